@@ -4,7 +4,14 @@ import tkinter as tk  # Tkinter GUI
 import sys            # Library to check platform/OS
 import os             # Used to change current directory
 import random         # Random number generator library
+import socket         # UDP sockets for the sACN / Art-Net network output
+import struct         # Encoding of the sACN / Art-Net packets
+import uuid           # sACN component identifier
+import threading      # Receiver thread of the sACN / Art-Net network input
+import json           # Warm-restart state snapshot file
+import queue          # Sensor edges passed from the GPIO callback thread to the main loop
 from subprocess import call
+import led_render     # LED values computation and sharded rendering
 
 # System variable, when InSitu == False the app does not access any GPIO, SPI, ...
 if(sys.platform == 'linux'):
@@ -70,6 +77,66 @@ if InSitu:
     spi.max_speed_hz = 8000000  # 8 MHz
 
 
+# Initialize the LEDCommand message to be sent through the SPI interface
+# LEDCommandSingle and LEDAllOffSingle are single messages for a single LED PWM module
+# LEDCommand and LEDAllOff are complete messages for "number_of_LED_modules" modules
+# !!!!! The first message goes to the LAST LED module on the chain (= farthest from the Raspberry Pi)
+# !!!!! The last message goes to the FIRST LED module on the chain (= module #0 = closest to the Raspberry Pi)
+# BLANK = 0  LEDs not blanked
+# DSPRPT = 1 PWM cycles auto repeat
+# TMGRST = 0 GS counters are not reset when a new command is received
+# EXTGCK = 0 Internal clock
+# OUTTMG = 1
+#
+#                           OE   TD
+#                           UX   MSB
+#                           TT   GPL
+#                           TG   RRA
+#                           MC   SPN
+#                     25h   GK   TTKBCB       BCG        BCR     OUTB3 OUTG3 OUTR3/OUTB2 OUTG2 OUTR2/OUTB1 OUTG1 OUTR1/OUTB0 OUTG0 OUTR0
+LEDCommandSingle = [0b10010110, 0b01011111, 0b11111111, 0b11111111, 0,
+                    0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+LEDAllOffSingle = [0b10010110, 0b01111111, 0b11111111, 0b11111111, 0,
+                   0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+
+# Duplicate LEDCommandSingle and LEDAllOffSingle "number_of_LED_modules" times into LEDCommand and LEDAllOff
+# LEDBaseCommand holds the base layer (normal schedule) of LEDCommand, see ComposeLEDCommand
+NumberOfLEDModules = 15
+LEDCommand = []
+LEDAllOff = []
+for _ in range(NumberOfLEDModules):
+    LEDCommand.extend(LEDCommandSingle)
+    LEDAllOff.extend(LEDAllOffSingle)
+LEDBaseCommand = list(LEDCommand)
+
+# Warm restart: send the last frame of the state snapshot (see SaveSnapshot) as soon as the SPI bus is open,
+# before the UI is built, so that the LED modules get their lights back right away after a shutdown or a power cut.
+# The rest of the snapshot is checked and restored later by RestoreSnapshot
+SnapshotFile = 'LEDController_state.json'
+
+
+def LoadSnapshot():
+    try:
+        with open(SnapshotFile) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+# Check that the frame of a snapshot fits the current chain of LED modules
+def SnapshotFrameValid(snapshot):
+    return isinstance(snapshot, dict) and isinstance(snapshot.get('frame'), list) and \
+        len(snapshot['frame']) == len(LEDCommand) and \
+        all(isinstance(byte, int) and byte >= 0 and byte <= 255 for byte in snapshot['frame'])
+
+
+Snapshot = LoadSnapshot()
+if SnapshotFrameValid(Snapshot):
+    LEDCommand[:] = Snapshot['frame']
+    if InSitu:
+        spi.writebytes(LEDCommand)
+
+
 # tkinter windows hierarchy
 # win
 # |- MainFrame
@@ -100,67 +167,37 @@ ListFrame.grid_propagate(False)
 TestFrame = tk.Frame(win, bg=MainBackColor, height=480, width=800)
 TestFrame.grid(row=0, column=0, sticky=tk.N+tk.E+tk.S+tk.W)
 TestFrame.grid_propagate(False)
-TestFrameActive = False   # Used to stop the automatic update of the lights when we are in test mode
 
 # Global variables for automatic Day/Night mode and Sky light on/off
 auto_day_night = False
 sky_on = True
 
-# Initialize the LEDCommand message to be sent through the SPI interface
-# LEDCommandSingle and LEDAllOffSingle are single messages for a single LED PWM module
-# LEDCommand and LEDAllOff are complete messages for "number_of_LED_modules" modules
-# !!!!! The first message goes to the LAST LED module on the chain (= farthest from the Raspberry Pi)
-# !!!!! The last message goes to the FIRST LED module on the chain (= module #0 = closest to the Raspberry Pi)
-# BLANK = 0  LEDs not blanked
-# DSPRPT = 1 PWM cycles auto repeat
-# TMGRST = 0 GS counters are not reset when a new command is received
-# EXTGCK = 0 Internal clock
-# OUTTMG = 1
-#
-#                           OE   TD
-#                           UX   MSB
-#                           TT   GPL
-#                           TG   RRA
-#                           MC   SPN
-#                     25h   GK   TTKBCB       BCG        BCR     OUTB3 OUTG3 OUTR3/OUTB2 OUTG2 OUTR2/OUTB1 OUTG1 OUTR1/OUTB0 OUTG0 OUTR0
-LEDCommandSingle = [0b10010110, 0b01011111, 0b11111111, 0b11111111, 0,
-                    0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-LEDAllOffSingle = [0b10010110, 0b01111111, 0b11111111, 0b11111111, 0,
-                   0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-
-# Duplicate LEDCommandSingle and LEDAllOffSingle "number_of_LED_modules" times into LEDCommand and LEDAllOff
-NumberOfLEDModules = 15
-LEDCommand = []
-LEDAllOff = []
-for _ in range(NumberOfLEDModules):
-    LEDCommand.extend(LEDCommandSingle)
-    LEDAllOff.extend(LEDAllOffSingle)
-
 
 ###############################################
-# Function to set an LED brightness in the LEDCommand message
+# Function to set an LED brightness in the base layer of the LEDCommand message (LEDBaseCommand)
 # This function DOES NOT SEND the LEDCommand message to the SPI bus
 # Modules are numbered 0 to number_of_LED_modules
 # Module #0 is the closest to the Raspberry Pi
 # A module has 12 ports numbered 0 to 11
 # LED brightness values in the command are 16-bit integers (0-65535)
 # The "value" parameter is in the range 0 (off) to 1000 (brightest)
-# The "value" parameter is gamma corrected before being stored in LEDCommand
+# The "value" parameter is gamma corrected before being stored in LEDBaseCommand
 def SetLEDBrightness(led, value):
-    global LEDCommand
+    WriteLEDBrightness(led, value, LEDBaseCommand, DMXBaseUniverses)
 
-    if value >= 0 and value <= 1000:
-        # Gamma correction
-        value = int(65535.00*(float(value)/1000.00)**(1.8))
 
-        if led['module'] < NumberOfLEDModules and led['port'] < 12:
-            # Compute the particular LED/port control word position in LEDCommand
-            # The length of the message is 28 bytes per LED module
-            # Each LED/port occupies 16 bits (two bytes)
-            pos = 26 - led['port']*2 + (NumberOfLEDModules-1-led['module'])*28
-            # Write the LED value into LEDCommand
-            LEDCommand[pos] = value >> 8     # MSB
-            LEDCommand[pos+1] = value & 255  # LSB
+# Function to write an LED brightness into a command message and DMX universes
+def WriteLEDBrightness(led, value, command, universes):
+    word = led_render.LEDBrightnessWord(led, value, NumberOfLEDModules)
+    if word is not None:
+        # Write the LED value into the command
+        command[word[0]] = word[1] >> 8     # MSB
+        command[word[0]+1] = word[1] & 255  # LSB
+    # Lights with a 'universe' key are also sent on the network (sACN / Art-Net)
+    if 'universe' in led:
+        dmx = led_render.LEDDMXWord(led, value, universes)
+        if dmx is not None:
+            universes[dmx[0]][dmx[1]] = dmx[2]
 
 
 # Initialize light_list from the file 'light_list.py'
@@ -186,14 +223,9 @@ day_night_transition_length = 60  # ????????????????????????????????????????????
 
 # Compute the values and (random) times of the sequences for all 'Random Day/Night' LEDs
 def RandomizeDayNightTime():
-    for led in light_list:
-        if led['mode'] == 'Random Day/Night':
-            time = round(random.uniform(10.0, 30.0), 1)
-            led['time_to_night'] = [0, time, time+0.2, 60]
-            led['value_to_night'] = [led['value_day'], led['value_day'], led['value_night'], led['value_night']]
-            time = round(random.uniform(10.0, 30.0), 1)
-            led['time_to_day'] = [0, time, time+0.2, 60]
-            led['value_to_day'] = [led['value_night'], led['value_night'], led['value_day'], led['value_day']]
+    led_render.RandomizeSequences(light_list)
+    # Share the new sequences with the worker processes of the sharded rendering
+    led_render.PublishRenderSequences()
 
 
 # Initialize all the constant LEDs values
@@ -203,46 +235,600 @@ def InitConstantLEDs():
             SetLEDBrightness(led, led['value'])
 
 
-# Function to compute the brightness of an LED (led) based on the current time (c_time)
-# Brightness values are interpolated from the sequence event tables
-def UpdateLED(c_time, led):
-    # Processing of Sky On/Off switch
-    # If the current led has its 'switch' key defined and equal to 'Sky' and the Sky switch is off
-    # then just set the led brightness to zero
+# Day/Night and Sky state used to compute the LED values (see led_render.ComputeLEDValue)
+def DayNightState():
+    return (sky_on, going_to_night, going_to_day, last_day_night_switch_time)
+
+
+# Sharded rendering of the LED values (see led_render.py)
+# When LEDRenderWorkers > 1, the values of light_list are computed by LEDRenderWorkers worker processes,
+# one per CPU core. LEDRenderWorkers = 1 keeps the single-threaded path, which is the fastest for small layouts.
+# Run 'python3 led_render.py' to measure the rendering throughput for 1 to 4 workers on the target
+LEDRenderWorkers = 1
+
+
+# SkyLED pixel strip
+# The colour of each pixel is interpolated between the gradients of sky_led (defined in 'light_list.py'),
+# following the progress of the day/night transition
+# The transition is quantized into SkySteps steps: the frame of each step is computed once, for all pixels,
+# then cached in SkyFrames and reused, so that updating the strip costs a lookup and, only when
+# the step changes, a single SPI write
+SkySteps = 200
+SkyFrames = {}
+SkyLastFrame = None
+
+
+# Compute the colour of every pixel of the strip for a gradient defined by a list of (position, (r, g, b)) stops
+def ComputeSkyGradient(stops):
+    pixels = []
+    number_of_pixels = sky_led['number_of_pixels']
+    stop = 0
+    for pixel in range(number_of_pixels):
+        position = pixel / max(number_of_pixels - 1, 1)
+        while stop < len(stops) - 2 and position > stops[stop+1][0]:
+            stop += 1
+        (pos0, col0), (pos1, col1) = stops[stop], stops[min(stop+1, len(stops)-1)]
+        if pos1 > pos0:
+            t = min(max((position - pos0) / (pos1 - pos0), 0.0), 1.0)
+        else:
+            t = 0.0
+        pixels.append(tuple(c0 + (c1 - c0) * t for c0, c1 in zip(col0, col1)))
+    return pixels
+
+
+SkyGradients = {name: ComputeSkyGradient(sky_led[name]) for name in ('day', 'sunset', 'night', 'sunrise')}
+
+# APA102 frames: 32-bit start frame, then one 32-bit word per pixel (brightness, blue, green, red), then end frame
+SkyStartFrame = bytes(4)
+SkyEndFrame = bytes([0xFF] * ((sky_led['number_of_pixels'] + 15) // 16))
+SkyAllOff = SkyStartFrame + bytes([0xE0, 0, 0, 0] * sky_led['number_of_pixels']) + SkyEndFrame
+
+
+# Initialize the SPI interface of the SkyLED strip, only when a strip is configured
+# The APA102 strip has no chip select input, it is connected to its own SPI bus (SPI1, MOSI and SCLK pins)
+# spi_sky stays None when there is no strip or when SPI1 is not enabled, and the strip is then never updated
+spi_sky = None
+if InSitu and sky_led['number_of_pixels'] > 0:
+    try:
+        spi_sky = spidev.SpiDev()
+        spi_sky.open(1, 0)
+        spi_sky.mode = 0
+        spi_sky.max_speed_hz = 8000000  # 8 MHz
+    except OSError:
+        spi_sky = None
+
+
+# Compute the APA102 frame of one step of the day/night transition
+# step goes from 0 (day) to SkySteps (night); the middle of the transition uses 'sunset' or 'sunrise'
+def ComputeSkyFrame(to_night, step):
+    middle = SkyGradients['sunset'] if to_night else SkyGradients['sunrise']
+    progress = step / SkySteps
+    if progress <= 0.5:
+        start, end, t = SkyGradients['day'], middle, progress * 2
+    else:
+        start, end, t = middle, SkyGradients['night'], progress * 2 - 1
+    frame = bytearray(SkyStartFrame)
+    brightness = 0xE0 | sky_led['brightness']
+    for (r0, g0, b0), (r1, g1, b1) in zip(start, end):
+        frame += bytes((brightness, int(b0 + (b1 - b0) * t), int(g0 + (g1 - g0) * t), int(r0 + (r1 - r0) * t)))
+    frame += SkyEndFrame
+    return bytes(frame)
+
+
+# Return the APA102 frame of the SkyLED strip for the current time (c_time)
+def GetSkyFrame(c_time):
+    if not sky_on:
+        return SkyAllOff
+    progress = min(max((c_time - last_day_night_switch_time) / day_night_transition_length, 0.0), 1.0)
+    if going_to_night:
+        step = int(progress * SkySteps)
+    else:
+        step = SkySteps - int(progress * SkySteps)
+    key = (going_to_night, step)
+    if key not in SkyFrames:
+        SkyFrames[key] = ComputeSkyFrame(going_to_night, step)
+    return SkyFrames[key]
+
+
+# Send the SkyLED strip frame, only when it has changed since the last one sent (the APA102 pixels hold their colour)
+def UpdateSky(c_time):
+    global SkyLastFrame
+    if spi_sky is None:
+        return
+    frame = GetSkyFrame(c_time)
+    if frame is not SkyLastFrame:
+        SkyLastFrame = frame
+        spi_sky.writebytes2(frame)
+
+
+# Network output of the lights having 'universe' and 'channel' keys, as sACN (E1.31) or Art-Net UDP packets
+# DMXUniverses holds the 512-channel DMX data of every universe used in light_list,
+# DMXBaseUniverses its base layer (normal schedule), see ComposeLEDCommand
+# Each universe is sent only when its data has changed, or every NetworkOutputKeepalive seconds
+# so that the nodes do not time out. The socket is non-blocking: a packet that cannot be sent immediately
+# is dropped (and sent again on the next frame), so a network stall never delays the SPI bus
+NetworkOutputProtocol = 'sACN'    # 'sACN' or 'Art-Net'
+NetworkOutputAddress = None       # IP address of the lighting node, None for sACN multicast / Art-Net broadcast
+NetworkOutputKeepalive = 1.0      # seconds
+NetworkOutputSourceName = 'YukariLED'
+sACNPort = 5568
+ArtNetPort = 6454
+
+
+# Check that a universe number is valid for a protocol: 1 to 63999 for sACN, 0 to 32767 (15-bit port address)
+# for Art-Net
+def NetworkUniverseValid(protocol, universe):
+    if protocol == 'sACN':
+        return universe >= 1 and universe <= 63999
+    return universe >= 0 and universe <= 32767
+
+
+# Lights with an invalid universe are not sent on the network
+DMXUniverses = {}
+DMXBaseUniverses = {}
+for led in light_list:
+    if 'universe' in led:
+        if not NetworkUniverseValid(NetworkOutputProtocol, led['universe']):
+            print("Light '{}': invalid {} universe {}, not sent on the network".format(
+                led['name'], NetworkOutputProtocol, led['universe']))
+            continue
+        DMXUniverses.setdefault(led['universe'], bytearray(512))
+        DMXBaseUniverses.setdefault(led['universe'], bytearray(512))
+
+NetworkOutputSocket = None
+NetworkOutputPort = None      # Local UDP port of NetworkOutputSocket, used by the network input to ignore our own packets
+NetworkOutputSent = {}        # Last data and time sent, for each universe
+NetworkOutputSequence = {}    # Sequence number of the last packet sent, for each universe
+sACNCID = uuid.uuid4().bytes
+
+
+# Build an sACN (E1.31) data packet for a universe (1-63999)
+def BuildsACNPacket(universe, sequence, data):
+    length = 126 + len(data)
+    # Root layer
+    packet = struct.pack('!HH12sHI16s', 0x0010, 0x0000, b'ASC-E1.17\x00\x00\x00', 0x7000 | (length - 16), 0x00000004, sACNCID)
+    # Framing layer
+    packet += struct.pack('!HI64sBHBBH', 0x7000 | (length - 38), 0x00000002, NetworkOutputSourceName.encode(), 100, 0,
+                          sequence, 0, universe)
+    # DMP layer
+    packet += struct.pack('!HBBHHHB', 0x7000 | (length - 115), 0x02, 0xA1, 0x0000, 0x0001, len(data) + 1, 0x00)
+    return packet + bytes(data)
+
+
+# Build an Art-Net ArtDmx packet for a universe (15-bit port address: net, sub-net, universe)
+def BuildArtNetPacket(universe, sequence, data):
+    return struct.pack('<8sH', b'Art-Net\x00', 0x5000) + \
+        struct.pack('!HBBBBH', 14, sequence, 0, universe & 0xFF, (universe >> 8) & 0x7F, len(data)) + bytes(data)
+
+
+# Destination of the packets of a universe
+def NetworkOutputDestination(universe):
+    if NetworkOutputProtocol == 'sACN':
+        if NetworkOutputAddress is None:
+            return ('239.255.{}.{}'.format(universe >> 8, universe & 0xFF), sACNPort)
+        return (NetworkOutputAddress, sACNPort)
+    if NetworkOutputAddress is None:
+        return ('255.255.255.255', ArtNetPort)
+    return (NetworkOutputAddress, ArtNetPort)
+
+
+def StartNetworkOutput():
+    global NetworkOutputSocket
+    global NetworkOutputPort
+    if not DMXUniverses:
+        return   # No light sent on the network
+    NetworkOutputSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    NetworkOutputSocket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    NetworkOutputSocket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    # Do not deliver our own multicast packets to the network input of this host
+    NetworkOutputSocket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 0)
+    NetworkOutputSocket.bind(('', 0))
+    NetworkOutputPort = NetworkOutputSocket.getsockname()[1]
+    NetworkOutputSocket.setblocking(False)
+
+
+# Send the universes which have changed, or have not been sent for NetworkOutputKeepalive seconds
+def SendNetworkOutput(c_time):
+    if NetworkOutputSocket is None:
+        return
+    for universe, data in DMXUniverses.items():
+        sent = NetworkOutputSent.get(universe)
+        if sent is not None and sent[0] == data and c_time - sent[1] < NetworkOutputKeepalive:
+            continue
+        if NetworkOutputProtocol == 'sACN':
+            sequence = (NetworkOutputSequence.get(universe, 0) + 1) & 0xFF
+            packet = BuildsACNPacket(universe, sequence, data)
+        else:
+            # Art-Net sequence 0 disables the sequence check of the node: wrap from 255 to 1
+            sequence = NetworkOutputSequence.get(universe, 0) % 255 + 1
+            packet = BuildArtNetPacket(universe, sequence, data)
+        try:
+            NetworkOutputSocket.sendto(packet, NetworkOutputDestination(universe))
+        except OSError:
+            continue   # Socket buffer full or network unreachable, try again on the next frame
+        NetworkOutputSequence[universe] = sequence
+        NetworkOutputSent[universe] = (bytes(data), c_time)
+
+
+# Close the socket, after switching off all the lights sent on the network if blackout is True
+# Otherwise the nodes keep the last frame received (or apply their own data loss behaviour)
+def StopNetworkOutput(blackout):
+    global NetworkOutputSocket
+    if NetworkOutputSocket is None:
+        return
+    if blackout:
+        for data in DMXUniverses.values():
+            data[:] = bytes(512)
+        NetworkOutputSent.clear()
+        SendNetworkOutput(time.perf_counter())
+    NetworkOutputSocket.close()
+    NetworkOutputSocket = None
+
+
+# Network input of live frames from a lighting console or show software, as sACN (E1.31) or Art-Net UDP packets
+# Lights are driven by the network input either individually, with their 'input_universe' and 'input_channel' keys,
+# or by module, with NetworkInputModules {universe: first module}: channel 1 to 12 of the universe drive the ports
+# 0 to 11 of the first module, channel 13 to 24 the ports of the next module, ...
+# The packets are received and decoded in a separate thread which only stores the latest data of each source.
+# The main loop merges the sources of each universe into the 'Remote' layer on every frame: the source with the
+# highest sACN priority wins (Art-Net sources have priority 100), sources of equal priority are merged channel by
+# channel (highest takes precedence). A source not heard from for NetworkInputTimeout seconds is dropped, and the
+# lights of a universe without any source go back to their normal schedule
+NetworkInputProtocol = 'sACN'     # 'sACN' or 'Art-Net'
+NetworkInputModules = {}
+NetworkInputTimeout = 2.5         # seconds
+NetworkInputReceiveBuffer = 1048576
+
+NetworkInputTargets = {}          # List of (channel index, light), for each universe
+for led in light_list:
+    if 'input_universe' in led and led['input_channel'] >= 1 and led['input_channel'] <= 512 and \
+            NetworkUniverseValid(NetworkInputProtocol, led['input_universe']):
+        NetworkInputTargets.setdefault(led['input_universe'], []).append((led['input_channel']-1, led))
+for universe, first_module in NetworkInputModules.items():
+    for module in range(first_module, min(first_module + 42, NumberOfLEDModules)):
+        for port in range(12):
+            # Drive the light of light_list on this module/port if any, otherwise the bare port
+            target = next((led for led in light_list if led['module'] == module and led['port'] == port),
+                          {'name': 'Module {} port {}'.format(module, port), 'mode': 'Constant', 'value': 0,
+                           'module': module, 'port': port})
+            NetworkInputTargets.setdefault(universe, []).append(((module - first_module) * 12 + port, target))
+
+NetworkInputSocket = None
+NetworkInputStop = threading.Event()
+NetworkInputSources = {}          # {source: (priority, data, time)}, for each universe
+NetworkInputLock = threading.Lock()
+NetworkInputLive = set()          # Universes driven by the network input on the last frame
+
+
+# Decode an sACN (E1.31) data packet or an Art-Net ArtDmx packet
+# Returns (universe, source, priority, data), with data None for a terminated sACN stream,
+# or None if the packet is not a DMX data packet, or is one of the packets sent by our own network output
+# (same sACN CID, or same Art-Net source port) which would otherwise feed the output back into the input
+def DecodeNetworkInputPacket(packet, address):
+    if NetworkInputProtocol == 'sACN':
+        if len(packet) < 126 or packet[4:16] != b'ASC-E1.17\x00\x00\x00' or packet[125] != 0:
+            return None
+        if packet[22:38] == sACNCID:
+            return None
+        if struct.unpack_from('!I', packet, 18)[0] != 0x00000004 or struct.unpack_from('!I', packet, 40)[0] != 0x00000002:
+            return None
+        options = packet[112]
+        if options & 0x80:
+            return None   # Preview data, not meant for live output
+        universe = struct.unpack_from('!H', packet, 113)[0]
+        if options & 0x40:
+            return (universe, packet[22:38], 0, None)   # Stream terminated
+        count = struct.unpack_from('!H', packet, 123)[0] - 1
+        return (universe, packet[22:38], packet[108], packet[126:126+count])
+    if len(packet) < 18 or packet[0:8] != b'Art-Net\x00' or struct.unpack_from('<H', packet, 8)[0] != 0x5000:
+        return None
+    if address[1] == NetworkOutputPort:
+        return None
+    length = struct.unpack_from('!H', packet, 16)[0]
+    return (packet[14] | (packet[15] << 8), address, 100, packet[18:18+length])
+
+
+# Receiver thread: store the latest data of each source of each universe
+# The socket is passed by StartNetworkInput, the thread stops when StopNetworkInput sets NetworkInputStop
+def NetworkInputReceiver(sock):
+    while not NetworkInputStop.is_set():
+        try:
+            packet, address = sock.recvfrom(1024)
+        except OSError:
+            continue   # Timeout, or socket closed by StopNetworkInput
+        decoded = DecodeNetworkInputPacket(packet, address)
+        if decoded is None or decoded[0] not in NetworkInputTargets:
+            continue
+        universe, source, priority, data = decoded
+        with NetworkInputLock:
+            sources = NetworkInputSources.setdefault(universe, {})
+            if data is None:
+                sources.pop(source, None)
+            else:
+                sources[source] = (priority, data, time.perf_counter())
+
+
+def StartNetworkInput():
+    global NetworkInputSocket
+    if not NetworkInputTargets:
+        return   # No light driven by the network input
+    NetworkInputSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    NetworkInputSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    NetworkInputSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, NetworkInputReceiveBuffer)
+    NetworkInputSocket.settimeout(0.5)
+    if NetworkInputProtocol == 'sACN':
+        NetworkInputSocket.bind(('', sACNPort))
+        for universe in NetworkInputTargets:
+            group = socket.inet_aton('239.255.{}.{}'.format(universe >> 8, universe & 0xFF))
+            NetworkInputSocket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, group + socket.inet_aton('0.0.0.0'))
+    else:
+        NetworkInputSocket.bind(('', ArtNetPort))
+    NetworkInputStop.clear()
+    threading.Thread(target=NetworkInputReceiver, args=(NetworkInputSocket,), daemon=True).start()
+
+
+def StopNetworkInput():
+    global NetworkInputSocket
+    if NetworkInputSocket is not None:
+        NetworkInputStop.set()
+        NetworkInputSocket.close()
+        NetworkInputSocket = None
+
+
+# Merge the live sources of a universe, returns None if the universe has no live source
+def MergeNetworkInputSources(universe, c_time):
+    with NetworkInputLock:
+        sources = NetworkInputSources.get(universe)
+        if not sources:
+            return None
+        for source in [source for source, (_, _, t) in sources.items() if c_time - t > NetworkInputTimeout]:
+            del sources[source]
+        if not sources:
+            return None
+        priority = max(p for p, _, _ in sources.values())
+        merged = [data for p, data, _ in sources.values() if p == priority]
+    if len(merged) == 1:
+        return merged[0]
+    return bytes(map(max, zip(*merged)))
+
+
+# Write the live network input into the 'Remote' layer, and release the lights of the universes that timed out
+def ApplyNetworkInput(c_time):
+    for universe, targets in NetworkInputTargets.items():
+        data = MergeNetworkInputSources(universe, c_time)
+        if data is None:
+            if universe in NetworkInputLive:
+                NetworkInputLive.discard(universe)
+                for _, led in targets:
+                    ClearLEDOverride('Remote', led)
+            continue
+        NetworkInputLive.add(universe)
+        for channel, led in targets:
+            if channel < len(data):
+                SetLEDOverride('Remote', led, data[channel] * 1000 // 255)
+
+
+# Sensor triggered lights ('Trigger' mode)
+# Occupancy detectors (sensor_list, defined in 'light_list.py') start and stop the sequences of the 'Trigger' lights.
+# Sensor edges are received from an input backend:
+# - on the Raspberry Pi, GPIO interrupts (RPi.GPIO event detection): the RPi.GPIO callback thread only queues
+#   the edge in SensorEdgeQueue and wakes up the tkinter main loop with a '<<SensorEdge>>' virtual event,
+#   so that the frame buffers are only ever touched by the main loop
+# - on the Mac, the function keys F1 to F12 toggle the sensors of sensor_list, and tests can call SimulateSensor()
+# Edges closer than SensorDebounce seconds to the previous accepted edge of the same sensor are not applied
+# immediately: the sensor is read again at the end of the debounce window, so that a short pulse is never lost.
+# An accepted edge immediately recomputes the lights of the sensor, composes and sends LEDCommand on the SPI bus,
+# without waiting for the next UpdateAllLEDs frame.
+# The latency from the edge to the end of the SPI write is measured in SensorLatency and displayed in the MainFrame,
+# a warning is printed for every edge above SensorLatencyBudget (a fraction of the 50 ms UpdateAllLEDs frame)
+SensorDebounce = 0.05          # seconds
+SensorLatencyBudget = 0.010    # seconds
+SensorLatency = {'count': 0, 'total': 0.0, 'max': 0.0}
+SensorEdgeQueue = queue.Queue()
+SensorGPIO = None              # RPi.GPIO module, when the GPIO input backend is started
+
+# 'level' is the last state reported by the input backend, 'read' reads the current state of the sensor
+Sensors = {}
+for sensor in sensor_list:
+    Sensors[sensor['name']] = {'pin': sensor['pin'], 'active_low': sensor.get('active_low', False), 'active': False,
+                               'level': False, 'time': None, 'last_edge': -1000.0, 'recheck': False, 'lights': []}
+    Sensors[sensor['name']]['read'] = lambda sensor=Sensors[sensor['name']]: sensor['level']
+TriggerLights = [led for led in light_list if led['mode'] == 'Trigger' and led['sensor'] in Sensors]
+for led in TriggerLights:
+    Sensors[led['sensor']]['lights'].append(led)
+
+# Function to compute the brightness of a 'Trigger' LED (led) based on the current time (c_time)
+# and the state of its sensor
+def ComputeTriggerLEDValue(c_time, led):
     if (not sky_on) and 'switch' in led and (led['switch'] == 'Sky'):
-        SetLEDBrightness(led, 0)
+        return 0
+    sensor = Sensors[led['sensor']]
+    if sensor['time'] is None:
+        # No edge received yet
+        if 'value_off' in led:
+            return int(led['value_off'][-1])
+        return led.get('value_idle', 0)
+    c_time = c_time - sensor['time']
+    if sensor['active']:
+        if led.get('repeat', False):
+            c_time = c_time % led['time'][-1]
+        elif c_time >= led['time'][-1]:
+            return int(led['value'][-1])
+        return led_render.InterpolateSequence(c_time, led['time'], led['value'])
+    if 'time_off' in led:
+        if c_time >= led['time_off'][-1]:
+            return int(led['value_off'][-1])
+        return led_render.InterpolateSequence(c_time, led['time_off'], led['value_off'])
+    return led.get('value_idle', 0)
+
+
+def UpdateTriggerLEDs(c_time, lights):
+    for led in lights:
+        value = ComputeTriggerLEDValue(c_time, led)
+        if value is not None:
+            SetLEDBrightness(led, value)
+
+
+# Sensor edge handler, called in the main loop with the new state of the sensor (active = train detected)
+def SensorEdge(name, active, edge_time=None):
+    if edge_time is None:
+        edge_time = time.perf_counter()
+    sensor = Sensors[name]
+    sensor['level'] = active
+    if active == sensor['active']:
         return
-    # LED Mode Cycle
-    if led['mode'] == 'Cycle':
-        c_time = c_time % led['time'][-1]
-        for ev in range(0, len(led['time'])-1):
-            if c_time <= led['time'][ev+1]:
-                SetLEDBrightness(led, int(led['value'][ev]+(c_time-led['time'][ev])*(
-                    led['value'][ev+1]-led['value'][ev])/(led['time'][ev+1]-led['time'][ev])))
-                return
+    remaining = SensorDebounce - (edge_time - sensor['last_edge'])
+    if remaining > 0:
+        # Too close to the previous edge: read the sensor again at the end of the debounce window
+        if not sensor['recheck']:
+            sensor['recheck'] = True
+            win.after(int(remaining * 1000) + 1, SensorRecheck, name)
         return
-    # LED Mode Day/Night and Random Day/Night
-    if led['mode'] in ('Day/Night', 'Random Day/Night'):
-        c_time = c_time - last_day_night_switch_time
-        if going_to_night:
-            if c_time >= led['time_to_night'][-1]:
-                SetLEDBrightness(led, int(led['value_to_night'][-1]))
-                return
-            for ev in range(0, len(led['time_to_night'])-1):
-                if c_time <= led['time_to_night'][ev+1]:
-                    SetLEDBrightness(led, int(led['value_to_night'][ev]+(c_time-led['time_to_night'][ev])*(
-                        led['value_to_night'][ev+1]-led['value_to_night'][ev])/(led['time_to_night'][ev+1]-led['time_to_night'][ev])))
-                    return
-        if going_to_day:
-            if c_time >= led['time_to_day'][-1]:
-                SetLEDBrightness(led, int(led['value_to_day'][-1]))
-                return
-            for ev in range(0, len(led['time_to_day'])-1):
-                if c_time <= led['time_to_day'][ev+1]:
-                    SetLEDBrightness(led, int(led['value_to_day'][ev]+(c_time-led['time_to_day'][ev])*(
-                        led['value_to_day'][ev+1]-led['value_to_day'][ev])/(led['time_to_day'][ev+1]-led['time_to_day'][ev])))
-                    return
+    sensor['last_edge'] = edge_time
+    sensor['active'] = active
+    sensor['time'] = edge_time
+    UpdateTriggerLEDs(time.perf_counter(), sensor['lights'])
+    ComposeLEDCommand()
+    SendLEDCommand()
+    latency = time.perf_counter() - edge_time
+    SensorLatency['count'] += 1
+    SensorLatency['total'] += latency
+    SensorLatency['max'] = max(SensorLatency['max'], latency)
+    if latency > SensorLatencyBudget:
+        print("Sensor '{}': edge to SPI latency {:.1f} ms, over the {:.1f} ms budget".format(
+            name, latency * 1000, SensorLatencyBudget * 1000))
+
+
+def SensorRecheck(name):
+    sensor = Sensors[name]
+    sensor['recheck'] = False
+    SensorEdge(name, sensor['read']())
+
+
+# '<<SensorEdge>>' virtual event handler: apply the edges queued by the GPIO callback thread
+def SensorEdgeEvent(event=0):
+    while not SensorEdgeQueue.empty():
+        SensorEdge(*SensorEdgeQueue.get())
+
+
+# Simulated input backend: set the state of a sensor
+def SimulateSensor(name, active):
+    SensorEdge(name, active)
+
+
+# Start the input backend
+# On the Raspberry Pi: one GPIO interrupt on both edges for each sensor
+# On the Mac: the function keys F1 to F12 toggle the sensors of sensor_list
+def StartSensors():
+    global SensorGPIO
+    if not Sensors:
         return
+    win.bind('<<SensorEdge>>', SensorEdgeEvent)
+    if not InSitu:
+        for key, name in enumerate(list(Sensors)[:12]):
+            win.bind('<KeyPress-F{}>'.format(key + 1),
+                     lambda event, name=name: SimulateSensor(name, not Sensors[name]['level']))
+        return
+    import RPi.GPIO as GPIO   # Only required when sensors are defined
+    SensorGPIO = GPIO
+    GPIO.setmode(GPIO.BCM)
+    for name, sensor in Sensors.items():
+        GPIO.setup(sensor['pin'], GPIO.IN, pull_up_down=GPIO.PUD_UP if sensor['active_low'] else GPIO.PUD_DOWN)
+        sensor['read'] = lambda sensor=sensor: GPIO.input(sensor['pin']) != sensor['active_low']
+        GPIO.add_event_detect(sensor['pin'], GPIO.BOTH,
+                              callback=lambda pin, name=name, sensor=sensor: SensorGPIOCallback(name, sensor))
+
+
+# GPIO callback, runs in the RPi.GPIO thread: queue the edge and wake up the main loop
+def SensorGPIOCallback(name, sensor):
+    if SensorGPIO is None:
+        return   # Input backend stopped, the tkinter window may already be destroyed
+    SensorEdgeQueue.put((name, sensor['read'](), time.perf_counter()))
+    try:
+        win.event_generate('<<SensorEdge>>', when='tail')
+    except (RuntimeError, tk.TclError):
+        pass     # Edge received while the window was being destroyed
+
+
+# Stop the input backend, before the tkinter window is destroyed
+def StopSensors():
+    global SensorGPIO
+    if SensorGPIO is None:
+        return
+    GPIO = SensorGPIO
+    SensorGPIO = None
+    for sensor in Sensors.values():
+        GPIO.remove_event_detect(sensor['pin'])
+    GPIO.cleanup()
+
+
+# Compositing of the LED values
+# LEDCommand is composed on every frame from the base layer (LEDBaseCommand and DMXBaseUniverses, written by
+# SetLEDBrightness with the normal schedule: Constant, Cycle, Day/Night and Trigger lights) and from
+# sparse override layers, in increasing priority order:
+# - 'Switch': lights switched on with the four switches
+# - 'Remote': lights driven by the network input
+# - 'Test': light being tested in the TestFrame
+# Each override layer only holds the overridden lights {id(light): (light, value)}, so that testing or overriding
+# one light leaves all the other lights running
+LEDLayers = {'Switch': {}, 'Remote': {}, 'Test': {}}
+
+
+def SetLEDOverride(layer, led, value):
+    LEDLayers[layer][id(led)] = (led, value)
+
+
+def ClearLEDOverride(layer, led):
+    LEDLayers[layer].pop(id(led), None)
+
+
+# Copy the base layer into LEDCommand and DMXUniverses, then write the overrides of all the layers on top
+def ComposeLEDCommand():
+    LEDCommand[:] = LEDBaseCommand
+    for universe, data in DMXBaseUniverses.items():
+        DMXUniverses[universe][:] = data
+    for layer in LEDLayers.values():
+        for led, value in layer.values():
+            WriteLEDBrightness(led, value, LEDCommand, DMXUniverses)
+
+
+# Change-aware transmission of LEDCommand on the SPI bus
+# The TLC59711 modules latch and hold their values, so LEDCommand is only sent when the bytes of at least one
+# module have changed since the last frame sent (LEDSentCommand), or every SPIKeepalive seconds to recover
+# from a glitch on the chain. The chain is a shift register: when a module has changed, the whole chain is sent
+# SPIStats counts the frames sent and suppressed, the bytes saved, and the modules changed in the last frame sent
+SPIKeepalive = 1.0   # seconds
+LEDSentCommand = []
+LEDSentTime = -1000.0
+SPIStats = {'sent': 0, 'suppressed': 0, 'bytes_saved': 0, 'dirty_modules': []}
+
+
+# List of the modules whose bytes in LEDCommand differ from the last frame sent
+def DirtyLEDModules():
+    if LEDCommand == LEDSentCommand:
+        return []
+    if len(LEDCommand) != len(LEDSentCommand):
+        return list(range(NumberOfLEDModules))
+    # The first 28 bytes of LEDCommand go to the last module of the chain
+    return [NumberOfLEDModules-1-position//28 for position in range(0, len(LEDCommand), 28)
+            if LEDCommand[position:position+28] != LEDSentCommand[position:position+28]]
+
+
+def SendLEDCommand(force=False):
+    global LEDSentCommand
+    global LEDSentTime
+    now = time.perf_counter()
+    dirty_modules = DirtyLEDModules()
+    if not force and not dirty_modules and now - LEDSentTime < SPIKeepalive:
+        SPIStats['suppressed'] += 1
+        SPIStats['bytes_saved'] += len(LEDCommand)
+        return
+    if InSitu:
+        spi.writebytes(LEDCommand)
+    LEDSentCommand = list(LEDCommand)
+    LEDSentTime = now
+    SPIStats['sent'] += 1
+    SPIStats['dirty_modules'] = dirty_modules
 
 
 # Function to trigger change to night time
@@ -294,34 +880,55 @@ def go_to_day(event=0):
 
 
 # Button service functions
+# Exit leaves the LED modules, the SkyLED strip and the network nodes holding their last frame,
+# which is sent again by the next start (see LoadSnapshot)
 def MainFrameExitButtonPressed(event=0):
+    StopSensors()
+    SaveSnapshot()
+    led_render.StopRenderPool()
+    StopNetworkInput()
+    StopNetworkOutput(blackout=False)
     if InSitu:
-        # Switch off all LEDs and close the SPI interface
-        spi.writebytes(LEDAllOff)
-        time.sleep(0.1)
+        # Close the SPI interface
         spi.close()
+        if spi_sky is not None:
+            spi_sky.close()
     # Exit
     win.destroy()
 
 
 def MainFrameShutdownButtonPressed(event=0):
+    StopSensors()
+    SaveSnapshot()
+    led_render.StopRenderPool()
+    StopNetworkInput()
+    StopNetworkOutput(blackout=True)
     if InSitu:
         # Switch off all LEDs and close the SPI interface
         spi.writebytes(LEDAllOff)
+        if spi_sky is not None:
+            spi_sky.writebytes2(SkyAllOff)
         time.sleep(0.1)
         spi.close()
+        if spi_sky is not None:
+            spi_sky.close()
         # Exit and shutdown
         call("sudo shutdown -h now", shell=True)
     win.destroy()
 
 
 def MainFrameEditButtonPressed(event=0):
+    global ListFrameActive
+    ListFrameActive = True
+    ListFrameRefresh()
     ListFrame.tkraise()
     if InSitu:
         win.config(cursor='arrow')
 
 
 def ListFrameBackButtonPressed(event=0):
+    global ListFrameActive
+    ListFrameActive = False
     MainFrame.tkraise()
     if InSitu:
         win.config(cursor='none')
@@ -330,12 +937,13 @@ def ListFrameBackButtonPressed(event=0):
 def ListFrameTestButtonPressed(event=0):
     global TestFrameCurrentLight
     global TestFrameCurrentValue
-    global TestFrameActive
+    global ListFrameActive
 
-    # Get the name of the light from the Listbox
-    Name = ListFrameListbox.get(tk.ACTIVE)
+    if ListFrameSelected is None:
+        return
     # TestFrameCurrentLight will point to the Light (which is a dictionary) currently being tested
-    TestFrameCurrentLight = next(item for item in light_list if item['name'] == Name)
+    TestFrameCurrentLight = ListFrameSelected
+    ListFrameActive = False
 
     # Copy the values of TestFrameCurrentLight into the corresponding TestFrame widgets
     TestFrameNameField.configure(text=TestFrameCurrentLight['name'])
@@ -348,15 +956,16 @@ def ListFrameTestButtonPressed(event=0):
         TestFrameCurrentValue = 500
     TestFrameValueField.configure(text=TestFrameCurrentValue)
 
-    # Record the fact that we are in the TestFrame
-    # Used to stop the automatic update of the lights when we are in test mode
-    TestFrameActive = True
+    # Override the light being tested, all the other lights keep running
+    SetLEDOverride('Test', TestFrameCurrentLight, TestFrameCurrentValue)
     TestFrame.tkraise()
 
 
 def TestFrameBackButtonPressed(event=0):
-    global TestFrameActive
-    TestFrameActive = False
+    global ListFrameActive
+    ClearLEDOverride('Test', TestFrameCurrentLight)
+    ListFrameActive = True
+    ListFrameRefresh()
     ListFrame.tkraise()
 
 
@@ -409,7 +1018,12 @@ MainFrameEditButton.grid(column=2, row=0, padx=ButtonPadX, pady=ButtonPadY)
 MainFrameTimeText = tk.StringVar()
 MainFrameTimeLabel = tk.Label(MainFrameToolbar, textvariable=MainFrameTimeText, font=(MainFont, LargeFontSize),
                               fg=MainFrontColor, bg=MainToolbarColor)
-MainFrameTimeLabel.grid(column=3, row=0, padx=LabelPadX, pady=LabelPadY, sticky=tk.E)
+MainFrameTimeLabel.grid(column=4, row=0, padx=LabelPadX, pady=LabelPadY, sticky=tk.E)
+
+MainFrameSPIText = tk.StringVar()
+MainFrameSPILabel = tk.Label(MainFrameToolbar, textvariable=MainFrameSPIText, font=(MainFont, SmallFontSize),
+                             fg=MainFrontColor, bg=MainToolbarColor)
+MainFrameSPILabel.grid(column=3, row=0, padx=LabelPadX, pady=LabelPadY, sticky=tk.E)
 
 for column in range(3):
     MainFrameToolbar.grid_columnconfigure(column, weight=1)
@@ -479,6 +1093,11 @@ MainFramePowerLabel = tk.Label(MainFrame, textvariable=MainFramePowerText, font=
                                fg=MainFrontColor, bg=MainBackColor)
 MainFramePowerLabel.grid(column=2, row=7, sticky=tk.E)
 
+MainFrameStatsText = tk.StringVar()
+MainFrameStatsLabel = tk.Label(MainFrame, textvariable=MainFrameStatsText, font=(MainFont, SmallFontSize),
+                               fg=MainFrontColor, bg=MainBackColor, justify=tk.RIGHT)
+MainFrameStatsLabel.grid(column=3, row=7, sticky=tk.E)
+
 for column in range(4):
     MainFrame.grid_columnconfigure(column, minsize=200)
 
@@ -491,20 +1110,209 @@ ListFrameTestButton = tk.Label(ListFrame, text='Test', font=(MainFont, LargeFont
                                bg=ButtonBackColor)
 ListFrameTestButton.grid(column=2, row=0, padx=ButtonPadX, pady=ButtonPadY, ipadx=10, sticky=tk.W)
 
+ListFrameSearchText = tk.StringVar()
+ListFrameSearchEntry = tk.Entry(ListFrame, textvariable=ListFrameSearchText, font=(MainFont, LargeFontSize),
+                                fg=EditFrontColor, bg=EditBackColor, relief=tk.FLAT)
+ListFrameSearchEntry.grid(column=1, row=0, padx=FieldPadX, pady=ButtonPadY, sticky=tk.W + tk.E)
+
+# The list of lights is virtualized: only ListFrameListboxHeight rows of widgets are created, whatever the number
+# of lights. The rows display the lights of ListFrameResults (the lights matching the search), from ListFrameFirstRow
+# ListFrameLights holds all the lights sorted by name, ListFrameResults and the search index hold positions in it
+# ListFrameSelected is the light (dictionary) selected for the Test button
+ListFrameLights = sorted(light_list, key=lambda k: k['name'])
+ListFrameLightIndex = {id(led): index for index, led in enumerate(ListFrameLights)}
+ListFrameResults = list(range(len(ListFrameLights)))
+ListFrameFirstRow = 0
+ListFrameSelected = ListFrameLights[0] if ListFrameLights else None
+ListFrameActive = False   # Used to refresh the live values only when the ListFrame is displayed
+ListFrameDragY = 0
+
+# Search index, built once: every substring of every word of the light names, lower case,
+# and the lights of each module, port, mode and switch
+# Filter values are lower case without spaces so that they can be typed as a single search term ('switch0'),
+# ListFrameFilterNames holds their display names ('Switch 0') for the filter buttons
+ListFrameSearchIndex = {}
+ListFrameFilterIndex = {'module': {}, 'port': {}, 'mode': {}, 'switch': {}}
+ListFrameFilterNames = {'module': {}, 'port': {}, 'mode': {}, 'switch': {}}
+for index, led in enumerate(ListFrameLights):
+    for word in led['name'].lower().split():
+        for start in range(len(word)):
+            for end in range(start + 1, len(word) + 1):
+                ListFrameSearchIndex.setdefault(word[start:end], set()).add(index)
+    for key, name in (('module', 'Module {}'.format(led['module'])), ('port', 'Port {}'.format(led['port'])),
+                      ('mode', led['mode']), ('switch', led.get('switch', 'No switch'))):
+        value = str(led[key]) if key in ('module', 'port') else name.lower().replace(' ', '')
+        ListFrameFilterIndex[key].setdefault(value, set()).add(index)
+        ListFrameFilterNames[key][value] = name
+ListFrameFilterValues = {key: sorted(values, key=int) if key in ('module', 'port') else sorted(values)
+                         for key, values in ListFrameFilterIndex.items()}
+
+# Filter buttons, for the touch screen: each button cycles through the values of its filter, then back to all
+# the lights, by writing its 'key:value' term into the search text (see ListFrameFilterPressed)
+ListFrameFilterBar = tk.Frame(ListFrame, bg=MainBackColor)
+ListFrameFilterBar.grid(column=0, columnspan=4, row=1, sticky=tk.W + tk.E)
+ListFrameFilterButtons = {}
+for column, key in enumerate(ListFrameFilterIndex):
+    ListFrameFilterButtons[key] = tk.Label(ListFrameFilterBar, text=key.capitalize(), font=(MainFont, SmallFontSize),
+                                           width=14, fg=ButtonFrontColor, bg=ButtonBackColor)
+    ListFrameFilterButtons[key].grid(column=column, row=0, padx=(ButtonPadX, 0), pady=(0, ButtonPadY), ipady=5)
+ListFrameClearButton = tk.Label(ListFrameFilterBar, text='Clear', font=(MainFont, SmallFontSize), fg=ButtonFrontColor,
+                                bg=ButtonBackColor)
+ListFrameClearButton.grid(column=len(ListFrameFilterIndex), row=0, padx=ButtonPadX, pady=(0, ButtonPadY), ipadx=10, ipady=5)
+
 ListFrameYScroll = tk.Scrollbar(ListFrame, orient=tk.VERTICAL, relief=tk.FLAT, troughcolor=ButtonBackColor, width=40)
-ListFrameListbox = tk.Listbox(ListFrame, font=(MainFont, LargeFontSize), height=ListFrameListboxHeight,
-                              yscrollcommand=ListFrameYScroll.set, activestyle='none',
-                              bg=MainBackColor, fg=MainFrontColor, selectmode=tk.SINGLE,
-                              selectbackground='light grey', selectforeground='black')
-ListFrameYScroll['command'] = ListFrameListbox.yview
-ListFrameListbox.grid(column=0, columnspan=3, row=2,
-                      rowspan=ListFrameListboxHeight, padx=10, sticky=tk.W + tk.E)
 ListFrameYScroll.grid(column=3, row=2, rowspan=ListFrameListboxHeight, sticky=tk.W + tk.N + tk.S)
 
-ListFrameListboxContent = [d['name'] for d in light_list]
-ListFrameListboxContent.sort()
-ListFrameListbox.insert(1, *ListFrameListboxContent)
-ListFrameListbox.selection_set(0)
+ListFrameRows = []
+for row in range(ListFrameListboxHeight):
+    ListFrameRowName = tk.Label(ListFrame, font=(MainFont, LargeFontSize), anchor=tk.W, bd=0, pady=0,
+                                bg=MainBackColor, fg=MainFrontColor)
+    ListFrameRowName.grid(column=0, columnspan=2, row=2 + row, padx=(10, 0), sticky=tk.W + tk.E)
+    ListFrameRowInfo = tk.Label(ListFrame, font=(MainFont, SmallFontSize), anchor=tk.E, bd=0, pady=0,
+                                bg=MainBackColor, fg=MainFrontColor)
+    ListFrameRowInfo.grid(column=2, row=2 + row, padx=(0, 10), sticky=tk.W + tk.E + tk.N + tk.S)
+    ListFrameRows.append((ListFrameRowName, ListFrameRowInfo))
+
+
+# Find the lights matching the search text
+# Words of the search text must all be found in the light name; the filters module:, port:, mode: and switch:
+# (e.g. 'module:3', 'mode:cycle', 'switch:sky', 'switch:switch0') select the lights by module, port, mode or switch
+def ListFrameSearch(*args):
+    global ListFrameResults
+    global ListFrameFirstRow
+    global ListFrameSelected
+    results = None
+    for term in ListFrameSearchText.get().lower().split():
+        key, _, value = term.partition(':')
+        if value and key in ListFrameFilterIndex:
+            # Filters match the beginning of the mode and switch names ('mode:day' matches 'Day/Night')
+            matches = set()
+            for name, lights in ListFrameFilterIndex[key].items():
+                if name == value or (key in ('mode', 'switch') and name.startswith(value)):
+                    matches |= lights
+        else:
+            matches = ListFrameSearchIndex.get(term, set())
+        results = matches if results is None else results & matches
+    ListFrameResults = list(range(len(ListFrameLights))) if results is None else sorted(results)
+    ListFrameFirstRow = 0
+    # The selected light must be one of the results, otherwise select the first result (if any)
+    if ListFrameSelected is None or (results is not None and ListFrameLightIndex[id(ListFrameSelected)] not in results):
+        ListFrameSelected = ListFrameLights[ListFrameResults[0]] if ListFrameResults else None
+    ListFrameFilterRefresh()
+    ListFrameRefresh()
+
+
+# Value of a filter in the search text, None if the filter is not used
+def ListFrameFilterValue(key):
+    for term in ListFrameSearchText.get().lower().split():
+        term_key, _, value = term.partition(':')
+        if term_key == key and value:
+            return value
+    return None
+
+
+# Display the value of each filter on its button, highlighted when the filter is used
+def ListFrameFilterRefresh():
+    for key, button in ListFrameFilterButtons.items():
+        value = ListFrameFilterValue(key)
+        if value is None:
+            button.configure(text=key.capitalize(), bg=ButtonBackColor, fg=ButtonFrontColor)
+        else:
+            button.configure(text=ListFrameFilterNames[key].get(value, value), bg='light grey', fg='black')
+
+
+# Filter button service function: select the next value of the filter, or all the lights after the last value
+# The other terms of the search text (typed words and filters) are kept
+def ListFrameFilterPressed(key):
+    value = ListFrameFilterValue(key)
+    values = ListFrameFilterValues[key]
+    index = values.index(value) + 1 if value in values else 0
+    terms = [term for term in ListFrameSearchText.get().split() if term.lower().partition(':')[0] != key]
+    if index < len(values):
+        terms.append('{}:{}'.format(key, values[index]))
+    ListFrameSearchText.set(' '.join(terms))
+
+
+def ListFrameClearButtonPressed(event=0):
+    ListFrameSearchText.set('')
+
+
+# Live value (0-1000) of a light, computed back from the gamma corrected value in LEDCommand
+def ListFrameLightValue(led):
+    word = led_render.LEDBrightnessWord(led, 0, NumberOfLEDModules)
+    if word is None:
+        return '----'
+    value = (LEDCommand[word[0]] << 8) | LEDCommand[word[0]+1]
+    return '{:4d}'.format(round(1000 * (value / 65535) ** (1 / 1.8)))
+
+
+# Display the lights of ListFrameResults from ListFrameFirstRow in the rows
+def ListFrameRefresh():
+    for row, (name_label, info_label) in enumerate(ListFrameRows):
+        if ListFrameFirstRow + row < len(ListFrameResults):
+            led = ListFrameLights[ListFrameResults[ListFrameFirstRow + row]]
+            if led is ListFrameSelected:
+                name_label.configure(text=led['name'], bg='light grey', fg='black')
+            else:
+                name_label.configure(text=led['name'], bg=MainBackColor, fg=MainFrontColor)
+            info_label.configure(text='{:d}/{:d}  {}'.format(led['module'], led['port'], ListFrameLightValue(led)))
+        else:
+            name_label.configure(text='', bg=MainBackColor)
+            info_label.configure(text='')
+    if ListFrameResults:
+        ListFrameYScroll.set(ListFrameFirstRow / len(ListFrameResults),
+                             min(ListFrameFirstRow + ListFrameListboxHeight, len(ListFrameResults)) / len(ListFrameResults))
+    else:
+        ListFrameYScroll.set(0, 1)
+
+
+# Scrollbar command: ('moveto', fraction) or ('scroll', number, 'units' or 'pages')
+def ListFrameScroll(*args):
+    global ListFrameFirstRow
+    if args[0] == 'moveto':
+        first = int(float(args[1]) * len(ListFrameResults))
+    else:
+        first = ListFrameFirstRow + int(args[1]) * (ListFrameListboxHeight if args[2] == 'pages' else 1)
+    ListFrameFirstRow = max(0, min(first, len(ListFrameResults) - ListFrameListboxHeight))
+    ListFrameRefresh()
+
+
+# Touching a row selects its light, dragging scrolls the list
+def ListFrameRowPressed(event, row):
+    global ListFrameSelected
+    global ListFrameDragY
+    ListFrameDragY = event.y_root
+    if ListFrameFirstRow + row < len(ListFrameResults):
+        ListFrameSelected = ListFrameLights[ListFrameResults[ListFrameFirstRow + row]]
+        ListFrameRefresh()
+
+
+def ListFrameRowDragged(event):
+    global ListFrameDragY
+    row_height = max(ListFrameRows[0][0].winfo_height(), 1)
+    rows = int((ListFrameDragY - event.y_root) / row_height)
+    if rows != 0:
+        ListFrameDragY -= rows * row_height
+        ListFrameScroll('scroll', rows, 'units')
+
+
+# Refresh the live values of the displayed lights
+def UpdateListFrame():
+    if ListFrameActive:
+        ListFrameRefresh()
+    win.after(250, UpdateListFrame)   # Come back in 250 ms
+
+
+ListFrameYScroll['command'] = ListFrameScroll
+ListFrameSearchText.trace_add('write', ListFrameSearch)
+for key, button in ListFrameFilterButtons.items():
+    button.bind('<Button-1>', lambda event, key=key: ListFrameFilterPressed(key))
+ListFrameClearButton.bind('<Button-1>', ListFrameClearButtonPressed)
+for row, widgets in enumerate(ListFrameRows):
+    for widget in widgets:
+        widget.bind('<Button-1>', lambda event, row=row: ListFrameRowPressed(event, row))
+        widget.bind('<B1-Motion>', ListFrameRowDragged)
+ListFrameRefresh()
 
 for column in range(3):
     ListFrame.grid_columnconfigure(column, weight=6)
@@ -529,7 +1337,7 @@ def TestFrameValuePadHandler(event):
         TestFrameCurrentValue = 1000
 
     TestFrameValueField.configure(text=TestFrameCurrentValue)
-    SetLEDBrightness(TestFrameCurrentLight, TestFrameCurrentValue)
+    SetLEDOverride('Test', TestFrameCurrentLight, TestFrameCurrentValue)
 
 
 TestFrameBackButton = tk.Label(TestFrame, text='< Back', font=(MainFont, LargeFontSize), bg=ButtonBackColor, fg=ButtonFrontColor)
@@ -585,11 +1393,11 @@ def toggle_switch(switch):
         return  # Exit function if there is no light with 'switch' == 'Switch X' in the list
     if switch_state[switch] is False:
         MainFrameLightButton[switch]["image"] = onButtonImage
-        SetLEDBrightness(light_toggled, light_toggled['value_on'])
+        SetLEDOverride('Switch', light_toggled, light_toggled['value_on'])
         switch_state[switch] = True
     else:
         MainFrameLightButton[switch]["image"] = offButtonImage
-        SetLEDBrightness(light_toggled, light_toggled['value'])
+        ClearLEDOverride('Switch', light_toggled)
         switch_state[switch] = False
 
 
@@ -634,14 +1442,19 @@ for Button in ButtonList:
 # Main loops
 # Update all LEDs
 def UpdateAllLEDs():
-    if TestFrameActive is False:    # Update LEDs only if we are not in TestFrame
-        now = time.perf_counter()
-        # Compute the value of each LED
-        for led in light_list:
-            UpdateLED(now, led)
-    if InSitu:
-        # Send the command message to all LEDs on the SPI bus
-        spi.writebytes(LEDCommand)
+    now = time.perf_counter()
+    # Compute the value of each LED
+    led_render.RenderAllLEDs(now, DayNightState(), light_list, NumberOfLEDModules, LEDBaseCommand, DMXBaseUniverses)
+    UpdateTriggerLEDs(now, TriggerLights)
+    # Live frames received from the network take precedence over the normal schedule
+    ApplyNetworkInput(now)
+    # Merge the base layer and the override layers into LEDCommand
+    ComposeLEDCommand()
+    # Send the command message to all LEDs on the SPI bus, if it has changed
+    SendLEDCommand()
+    # Update the SkyLED strip and the network nodes after the LED modules so that they never delay them
+    UpdateSky(time.perf_counter())
+    SendNetworkOutput(time.perf_counter())
     win.after(50, UpdateAllLEDs)   # Come back in 50 ms
 
 
@@ -685,6 +1498,28 @@ def UpdateVoltageDisplay():
         MainFramePowerText.set("---- W")
 
 
+# Display the SPI frames sent per second and the share of frames suppressed since the last update (see SPIStats),
+# and the sensor edge to SPI latency (average / maximum), in orange when the maximum is over the budget
+StatsLastSPI = {'sent': 0, 'suppressed': 0}
+
+
+def UpdateStatsDisplay():
+    sent = SPIStats['sent'] - StatsLastSPI['sent']
+    suppressed = SPIStats['suppressed'] - StatsLastSPI['suppressed']
+    StatsLastSPI['sent'], StatsLastSPI['suppressed'] = SPIStats['sent'], SPIStats['suppressed']
+    if sent + suppressed > 0:
+        MainFrameSPIText.set("SPI {:d} frames/s, {:.0f}% skipped".format(sent, 100 * suppressed / (sent + suppressed)))
+    else:
+        MainFrameSPIText.set("SPI ----")
+    if SensorLatency['count'] > 0:
+        MainFrameStatsText.set("Sensor {:.1f}/{:.1f} ms".format(
+            SensorLatency['total'] / SensorLatency['count'] * 1000, SensorLatency['max'] * 1000))
+    else:
+        MainFrameStatsText.set("Sensor ----")
+    MainFrameStatsLabel["fg"] = ButtonFrontColor if SensorLatency['max'] > SensorLatencyBudget else MainFrontColor
+    win.after(1000, UpdateStatsDisplay)   # Come back in 1 s
+
+
 # Display the day/night progress bar
 def UpdateProgressBar():
     now = time.perf_counter()
@@ -736,18 +1571,135 @@ def UpdateProgressBar():
     win.after(100, UpdateProgressBar)   # Come back in 100 ms
 
 
+# Warm-restart state snapshots
+# Every SnapshotPeriod seconds, the runtime state is saved into SnapshotFile: day/night phase, Random Day/Night
+# sequences, switches, Sky and Auto modes, and the last LEDCommand frame.
+# The file is written to a temporary file then renamed, so that it is always complete.
+# At startup, the last frame is sent first (see LoadSnapshot) and the state is restored, so that a restart does
+# not blank the layout or jump back to day. Exit leaves the LED modules, the SkyLED strip and the network nodes
+# holding their last frame, only Shutdown switches them off. The day/night phase is saved relative to last_day_night_switch_time
+# (time.perf_counter() restarts with the process) and the time during which the app was not running is added back
+SnapshotPeriod = 5   # seconds
+
+
+# Key identifying a light in the snapshot, the same name may be used by more than one light
+def SnapshotLightKey(led):
+    return '{}/{}/{}'.format(led['name'], led['module'], led['port'])
+
+
+def SaveSnapshot():
+    snapshot = {'wall_time': time.time(),
+                'day_night_phase': time.perf_counter() - last_day_night_switch_time,
+                'going_to_night': going_to_night,
+                'going_to_day': going_to_day,
+                'switch_state': switch_state,
+                'sky_on': sky_on,
+                'auto_day_night': auto_day_night,
+                'frame': LEDCommand,
+                'sequences': {SnapshotLightKey(led): [led['time_to_night'], led['value_to_night'],
+                                                      led['time_to_day'], led['value_to_day']]
+                              for led in light_list if led['mode'] == 'Random Day/Night'}}
+    try:
+        with open(SnapshotFile + '.tmp', 'w') as fp:
+            json.dump(snapshot, fp)
+        os.replace(SnapshotFile + '.tmp', SnapshotFile)
+    except OSError:
+        pass   # Snapshots are best effort, never stop the app
+
+
+def UpdateSnapshot():
+    SaveSnapshot()
+    win.after(SnapshotPeriod * 1000, UpdateSnapshot)   # Come back in SnapshotPeriod s
+
+
+# Check that a snapshot has all the keys of SaveSnapshot, with the right types, and that it matches light_list
+def SnapshotValid(snapshot):
+    def number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    if not isinstance(snapshot, dict):
+        return False
+    if not all(number(snapshot.get(key)) for key in ('wall_time', 'day_night_phase')):
+        return False
+    if not all(isinstance(snapshot.get(key), bool) for key in ('going_to_night', 'going_to_day', 'sky_on', 'auto_day_night')):
+        return False
+    if not isinstance(snapshot.get('switch_state'), list) or len(snapshot['switch_state']) != len(switch_state) or \
+            not all(isinstance(state, bool) for state in snapshot['switch_state']):
+        return False
+    if not SnapshotFrameValid(snapshot):
+        return False
+    if not isinstance(snapshot.get('sequences'), dict):
+        return False
+    # Every 'Random Day/Night' light needs its four sequences of four events (see RandomizeDayNightTime)
+    for led in light_list:
+        if led['mode'] == 'Random Day/Night':
+            sequences = snapshot['sequences'].get(SnapshotLightKey(led))
+            if not isinstance(sequences, list) or len(sequences) != 4:
+                return False
+            for sequence in sequences:
+                if not isinstance(sequence, list) or len(sequence) != 4 or not all(number(value) for value in sequence):
+                    return False
+    return True
+
+
+# Restore the state of the snapshot loaded at startup (its frame has already been sent),
+# returns False if there is no usable snapshot
+# The snapshot is fully checked before anything is restored: it is restored completely or not at all
+def RestoreSnapshot():
+    global last_day_night_switch_time
+    global going_to_night
+    global going_to_day
+    global sky_on
+    global auto_day_night
+    snapshot = Snapshot
+    try:
+        if not SnapshotValid(snapshot):
+            return False   # No snapshot, damaged snapshot, or light_list has changed: cold start
+    except (KeyError, TypeError, ValueError):
+        return False
+
+    downtime = max(time.time() - snapshot['wall_time'], 0.0)
+    last_day_night_switch_time = time.perf_counter() - snapshot['day_night_phase'] - downtime
+    going_to_night = snapshot['going_to_night']
+    going_to_day = snapshot['going_to_day']
+
+    for led in light_list:
+        if led['mode'] == 'Random Day/Night':
+            sequences = snapshot['sequences'][SnapshotLightKey(led)]
+            led['time_to_night'], led['value_to_night'], led['time_to_day'], led['value_to_day'] = sequences
+    led_render.PublishRenderSequences()
+
+    if snapshot['sky_on'] != sky_on:
+        MainFrameSkyButtonPressed()
+    auto_day_night = snapshot['auto_day_night']
+    MainFrameAutoButton["image"] = onButtonImage if auto_day_night else offButtonImage
+    for switch in range(len(switch_state)):
+        if snapshot['switch_state'][switch] != switch_state[switch]:
+            toggle_switch(switch)
+    return True
+
+
 # Start loop update functions, then the main tkinter loop
+led_render.StartRenderPool(light_list, LEDRenderWorkers)   # Called once, before any other thread is started
+StartNetworkOutput()                    # Called once
+StartNetworkInput()                     # Called once
+StartSensors()                          # Called once
 InitConstantLEDs()                      # Called once
-RandomizeDayNightTime()                 # Called once
+if not RestoreSnapshot():               # Called once
+    RandomizeDayNightTime()
 
 UpdateAllLEDs()                         # Called repetitively using .after()
 UpdateTimeDisplay()                     # Called repetitively using .after()
 UpdateProgressBar()                     # Called repetitively using .after()
 UpdateVoltageDisplay()                  # Called repetitively using .after()
+UpdateStatsDisplay()                    # Called repetitively using .after()
+UpdateSnapshot()                        # Called repetitively using .after()
+UpdateListFrame()                       # Called repetitively using .after()
 
 MainFrame.tkraise()                     # Called once
 if auto_day_night:
-    # Start dayNightUpdate in day_night_auto_period seconds
-    dayNightUpdateCallbackID = win.after(day_night_auto_period * 1000, dayNightUpdate)
+    # Start dayNightUpdate at the end of the current day_night_auto_period (restored from the snapshot if any)
+    remaining_period = day_night_auto_period - (time.perf_counter() - last_day_night_switch_time)
+    dayNightUpdateCallbackID = win.after(int(max(remaining_period, 0) * 1000), dayNightUpdate)
 
 win.mainloop()                          # Main tkinter event loop
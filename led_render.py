@@ -0,0 +1,303 @@
+# LED rendering
+# Computation of the LED brightness values from the sequences of light_list, and sharded rendering of these values
+# by a pool of worker processes
+# This module does not use tkinter nor the LED hardware: it is imported by LEDController.py, and can be run on its own
+# to measure the sharded rendering throughput, without a display:
+#   python3 led_render.py [number_of_modules] [frames]
+
+# Import libraries
+import time           # Time management functions
+import sys            # Command line arguments of the benchmark
+import os             # Number of CPU cores
+import random         # Random number generator library
+import pickle         # Used to measure the cost of the results returned by the worker processes
+import multiprocessing  # Worker processes for the sharded rendering of the LED values
+
+
+# The Day/Night and Sky state used to compute the LED values is passed explicitly in 'state':
+# state = (sky_on, going_to_night, going_to_day, last_day_night_switch_time)
+
+
+# Compute the values and (random) times of the sequences for all 'Random Day/Night' LEDs
+def RandomizeSequences(lights):
+    for led in lights:
+        if led['mode'] == 'Random Day/Night':
+            time = round(random.uniform(10.0, 30.0), 1)
+            led['time_to_night'] = [0, time, time+0.2, 60]
+            led['value_to_night'] = [led['value_day'], led['value_day'], led['value_night'], led['value_night']]
+            time = round(random.uniform(10.0, 30.0), 1)
+            led['time_to_day'] = [0, time, time+0.2, 60]
+            led['value_to_day'] = [led['value_night'], led['value_night'], led['value_day'], led['value_day']]
+
+
+# Function to compute the brightness of an LED (led) based on the current time (c_time)
+# Brightness values are interpolated from the sequence event tables
+# Returns None when the LED brightness is not driven by its sequence (e.g. 'Constant' LEDs)
+def ComputeLEDValue(c_time, led, state):
+    sky_on, going_to_night, going_to_day, last_day_night_switch_time = state
+    # Processing of Sky On/Off switch
+    # If the current led has its 'switch' key defined and equal to 'Sky' and the Sky switch is off
+    # then just set the led brightness to zero
+    if (not sky_on) and 'switch' in led and (led['switch'] == 'Sky'):
+        return 0
+    # LED Mode Cycle
+    if led['mode'] == 'Cycle':
+        c_time = c_time % led['time'][-1]
+        return InterpolateSequence(c_time, led['time'], led['value'])
+    # LED Mode Day/Night and Random Day/Night
+    if led['mode'] in ('Day/Night', 'Random Day/Night'):
+        c_time = c_time - last_day_night_switch_time
+        if going_to_night:
+            if c_time >= led['time_to_night'][-1]:
+                return int(led['value_to_night'][-1])
+            value = InterpolateSequence(c_time, led['time_to_night'], led['value_to_night'])
+            if value is not None:
+                return value
+        if going_to_day:
+            if c_time >= led['time_to_day'][-1]:
+                return int(led['value_to_day'][-1])
+            return InterpolateSequence(c_time, led['time_to_day'], led['value_to_day'])
+        return None
+    return None
+
+
+# Function to interpolate the value of a sequence (event times, event values) at time c_time
+# Returns None if c_time is after the last event of the sequence
+def InterpolateSequence(c_time, times, values):
+    for ev in range(0, len(times)-1):
+        if c_time <= times[ev+1]:
+            return int(values[ev]+(c_time-times[ev])*(values[ev+1]-values[ev])/(times[ev+1]-times[ev]))
+    return None
+
+
+# Function to compute the position in LEDCommand and the gamma corrected 16-bit value of an LED brightness
+# Modules are numbered 0 to number_of_modules-1, module #0 is the closest to the Raspberry Pi
+# Returns None if the value or the module/port of the LED are out of range
+def LEDBrightnessWord(led, value, number_of_modules):
+    if value >= 0 and value <= 1000:
+        # Gamma correction
+        value = int(65535.00*(float(value)/1000.00)**(1.8))
+
+        if led['module'] < number_of_modules and led['port'] < 12:
+            # Compute the particular LED/port control word position in LEDCommand
+            # The length of the message is 28 bytes per LED module
+            # Each LED/port occupies 16 bits (two bytes)
+            pos = 26 - led['port']*2 + (number_of_modules-1-led['module'])*28
+            return (pos, value)
+    return None
+
+
+# Function to compute the universe, the position in the universe DMX data and the 8-bit value of an LED brightness,
+# for the lights sent on the network
+# The value is linear, like the values received by the network input: the lighting node applies its own dimmer curve,
+# and a gamma correction at 8 bits would crush the low end (values up to 42 would be sent as 0)
+# DMX channels are numbered 1 to 512
+# Returns None if the value or the channel of the LED are out of range, or if its universe is not in universes
+def LEDDMXWord(led, value, universes):
+    if value >= 0 and value <= 1000 and led['channel'] >= 1 and led['channel'] <= 512 and led['universe'] in universes:
+        return (led['universe'], led['channel']-1, int(round(value * 255 / 1000)))
+    return None
+
+
+# Compute the LEDCommand words (position, gamma corrected value) and the DMX words (universe, position, value)
+# of a list of lights
+def RenderLights(lights, c_time, state, number_of_modules, universes):
+    words = []
+    dmx_words = []
+    for led in lights:
+        value = ComputeLEDValue(c_time, led, state)
+        if value is not None:
+            word = LEDBrightnessWord(led, value, number_of_modules)
+            if word is not None:
+                words.append(word)
+            if 'universe' in led:
+                dmx = LEDDMXWord(led, value, universes)
+                if dmx is not None:
+                    dmx_words.append(dmx)
+    return words, dmx_words
+
+
+# Write LEDCommand words and DMX words into a command message and DMX universes
+def WriteWords(words, dmx_words, command, universes):
+    for pos, value in words:
+        command[pos] = value >> 8     # MSB
+        command[pos+1] = value & 255  # LSB
+    for universe, pos, value in dmx_words:
+        universes[universe][pos] = value
+
+
+# Sharded rendering of the LED values
+# When the pool is started with more than one worker, the lights are split by module range into shards
+# and the values of each shard are computed by a separate worker process, one per CPU core.
+# The main process then writes the values returned by all the shards into the command, in shard order,
+# so that the resulting command is identical to the one computed by the single-threaded path.
+# The worker processes are forked once at startup, before any other thread is started, and inherit the lights.
+# The 'Random Day/Night' sequences change at every day/night switch (see RandomizeSequences): they are
+# published in RenderSequences, an array in shared memory, and RenderSequenceVersion is passed with every
+# frame so that the workers reload them when they have changed.
+# A single worker keeps the single-threaded path, which is the fastest for small layouts: every frame pays for
+# a round trip to the workers, and the main process still has to unpickle and write every value.
+# Run 'python3 led_render.py' to measure the rendering throughput for 1 to 4 workers
+RenderPool = None
+RenderShards = []
+RenderRandomLights = []         # 'Random Day/Night' lights, in the order of RenderSequences
+RenderSequences = None          # 16 values per light: time_to_night, value_to_night, time_to_day, value_to_day
+RenderSequenceVersion = 0
+RenderWorkerVersion = -1        # Version of the sequences loaded by a worker process
+
+
+# Split the lights by module range into 'workers' shards holding a similar number of lights
+# A module is never split across two shards
+def BuildRenderShards(lights, workers):
+    lights = sorted(lights, key=lambda k: k['module'])
+    shard_size = -(-len(lights) // workers)
+    shards = [[]]
+    for led in lights:
+        shard = shards[-1]
+        if len(shard) >= shard_size and shard[-1]['module'] != led['module'] and len(shards) < workers:
+            shards.append([])
+        shards[-1].append(led)
+    return shards
+
+
+# Start the pool of worker processes used for the sharded rendering
+# Must be called before starting any thread: forking a multi-threaded process is unsafe
+def StartRenderPool(lights, workers):
+    global RenderPool
+    global RenderShards
+    global RenderRandomLights
+    global RenderSequences
+    StopRenderPool()
+    if workers <= 1:
+        return
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        return  # fork is not available on this platform, keep the single-threaded path
+    RenderShards = BuildRenderShards(lights, workers)
+    RenderRandomLights = [led for led in lights if led['mode'] == 'Random Day/Night']
+    RenderSequences = context.RawArray('d', 16 * len(RenderRandomLights))
+    PublishRenderSequences()
+    RenderPool = context.Pool(workers)
+
+
+# Copy the sequences of the 'Random Day/Night' lights into the shared memory of the worker processes
+def PublishRenderSequences():
+    global RenderSequenceVersion
+    if RenderSequences is None or any('time_to_night' not in led for led in RenderRandomLights):
+        return   # No worker process, or sequences not computed yet
+    for index, led in enumerate(RenderRandomLights):
+        RenderSequences[index*16:index*16+16] = (led['time_to_night'] + led['value_to_night'] +
+                                                 led['time_to_day'] + led['value_to_day'])
+    RenderSequenceVersion += 1
+
+
+# Reload the sequences of the 'Random Day/Night' lights from the shared memory (in a worker process)
+def LoadRenderSequences(version):
+    global RenderWorkerVersion
+    for index, led in enumerate(RenderRandomLights):
+        sequences = RenderSequences[index*16:index*16+16]
+        led['time_to_night'], led['value_to_night'] = sequences[0:4], sequences[4:8]
+        led['time_to_day'], led['value_to_day'] = sequences[8:12], sequences[12:16]
+    RenderWorkerVersion = version
+
+
+def StopRenderPool():
+    global RenderPool
+    if RenderPool is not None:
+        RenderPool.terminate()
+        RenderPool = None
+
+
+# Compute the words of all the LEDs of one shard
+# This function runs in a worker process
+def RenderShard(shard, c_time, state, version, number_of_modules, universes):
+    if version != RenderWorkerVersion:
+        LoadRenderSequences(version)
+    return RenderLights(RenderShards[shard], c_time, state, number_of_modules, universes)
+
+
+# Compute the values of all the lights and write them into command and universes,
+# with the worker processes if the pool is started
+def RenderAllLEDs(c_time, state, lights, number_of_modules, command, universes):
+    if RenderPool is None:
+        WriteWords(*RenderLights(lights, c_time, state, number_of_modules, universes), command, universes)
+        return
+    keys = tuple(universes)
+    shards = [(shard, c_time, state, RenderSequenceVersion, number_of_modules, keys) for shard in range(len(RenderShards))]
+    for words, dmx_words in RenderPool.starmap(RenderShard, shards):
+        WriteWords(words, dmx_words, command, universes)
+
+
+# Build a synthetic layout of number_of_modules modules, 12 lights per module, by repeating the lights
+def BenchmarkLayout(lights, number_of_modules):
+    layout = []
+    for module in range(number_of_modules):
+        for port in range(12):
+            led = dict(lights[(module * 12 + port) % len(lights)])
+            led['module'], led['port'] = module, port
+            layout.append(led)
+    return layout
+
+
+# Measure the rendering throughput of a large synthetic layout for 1 to 4 worker processes, check that all the
+# frames are identical, then estimate the number of lights above which 2 to 4 workers are faster than one,
+# assuming as many free CPU cores as workers:
+# a sharded frame costs a fixed round trip to the workers, its share of the computation, and the unpickling
+# and writing of every value in the main process
+def RenderBenchmark(lights, number_of_modules=400, frames=100):
+    command_single = [0b10010110, 0b01011111, 0b11111111, 0b11111111] + [0] * 24
+    lights = BenchmarkLayout([led for led in lights if 'universe' not in led], number_of_modules)
+    RandomizeSequences(lights)
+    start_time = time.perf_counter()
+    state = (True, True, False, start_time)   # Going to night, during the transition
+    reference = None
+    print('{} lights, {} modules, {} CPU cores'.format(len(lights), number_of_modules, os.cpu_count()))
+    for workers in range(1, 5):
+        StartRenderPool(lights, workers)
+        command = command_single * number_of_modules
+        frame_list = []
+        elapsed = time.perf_counter()
+        for frame in range(frames):
+            RenderAllLEDs(start_time + frame * 0.05, state, lights, number_of_modules, command, {})
+            frame_list.append(list(command))
+        elapsed = time.perf_counter() - elapsed
+        StopRenderPool()
+        if reference is None:
+            reference = frame_list
+        print('{} worker(s): {:6.2f} ms/frame, {:7.0f} lights/s, frames identical: {}'.format(
+            workers, elapsed * 1000 / frames, len(lights) * frames / elapsed, frame_list == reference))
+
+    # Cost per light of the computation, and of the unpickling and writing of the results in the main process
+    command = command_single * number_of_modules
+    elapsed = time.perf_counter()
+    for frame in range(frames):
+        results = RenderLights(lights, start_time + frame * 0.05, state, number_of_modules, {})
+    compute = (time.perf_counter() - elapsed) / frames / len(lights)
+    data = pickle.dumps(results)
+    elapsed = time.perf_counter()
+    for frame in range(frames):
+        WriteWords(*pickle.loads(data), command, {})
+    assemble = (time.perf_counter() - elapsed) / frames / len(lights)
+    print('Per light: {:.2f} us computation, {:.2f} us unpickling and writing in the main process'.format(
+        compute * 1e6, assemble * 1e6))
+    for workers in range(2, 5):
+        # Round trip to the workers, measured with one light per shard
+        StartRenderPool(BenchmarkLayout(lights, workers), workers)
+        elapsed = time.perf_counter()
+        for frame in range(frames):
+            RenderAllLEDs(start_time + frame * 0.05, state, [], workers, command_single * workers, {})
+        overhead = (time.perf_counter() - elapsed) / frames
+        StopRenderPool()
+        gain = compute * (1 - 1 / workers) - assemble
+        if gain > 0:
+            crossover = '{:.0f} lights ({:.0f} modules)'.format(overhead / gain, overhead / gain / 12)
+        else:
+            crossover = 'never'
+        print('{} workers: {:.2f} ms round trip per frame, faster than 1 worker above {}'.format(
+            workers, overhead * 1000, crossover))
+
+
+if __name__ == '__main__':
+    from light_list import light_list
+    RenderBenchmark(light_list, *[int(arg) for arg in sys.argv[1:3]])
@@ -4,11 +4,17 @@
 #       Day/Night: Go through the 'to_night' or 'to_day' sequence then hold the last value.
 #       Random Day/Night: Switch, at a random time, between 'value_day' during the day and 'value_night' during the night.
 #       Constant: Constant value at 'value', possibly change to 'value_on' using a switch.
+#       Trigger: Go through the 'time'/'value' sequence when the sensor 'sensor' detects a train, then hold the last value
+#                (or cycle through the sequence while the train is detected if 'repeat' is True).
+#                When the train has left, go through the optional 'time_off'/'value_off' sequence then hold the last value,
+#                or set 'value_idle' (default 0).
 # time: list of sequence event times (in seconds)
 # value: list of sequence event values (0-1000) corresponding to event times
 # switch: if 'Sky', 'Switch 0', 'Switch 1', 'Switch 2', 'Switch 3', light controlled by the corresponding switch
 # module: address of the TLC59711 module, from 0. SkyLEDModule (= 100) is reserved for SkyLED LEDs 
 # port: port of the corresponding PWM output, 0 to 11
+# universe, channel: optional, DMX universe and channel (1 to 512) of the light on a network lighting node (sACN / Art-Net)
+# input_universe, input_channel: optional, DMX universe and channel (1 to 512) driving the light from the network input
 
 light_list = [
     {'name': 'U/G left',      'mode': 'Constant', 'value': 0, 'value_on': 1000, 'switch': 'Switch 0', 'module': 0, 'port': 6},
@@ -99,4 +105,33 @@ light_list = [
     {'name': 'Parking car 5', 'mode': 'Cycle', 'time': [0.0, 35.0, 35.01, 45.0], 'value': [100, 100, 0, 0], 'module': 1, 'port': 8},
     {'name': 'Parking car 6', 'mode': 'Cycle', 'time': [0.0, 22.0, 22.01, 25.0], 'value': [100, 100, 0, 0], 'module': 1, 'port': 9},
     {'name': 'Parking car 7', 'mode': 'Cycle', 'time': [0.0, 27.0, 27.01, 33.0], 'value': [100, 100, 0, 0], 'module': 1, 'port': 10},
-    {'name': 'Parking car 8', 'mode': 'Cycle', 'time': [0.0, 38.0, 38.01, 41.0], 'value': [100, 100, 0, 0], 'module': 1, 'port': 11}]
\ No newline at end of file
+    {'name': 'Parking car 8', 'mode': 'Cycle', 'time': [0.0, 38.0, 38.01, 41.0], 'value': [100, 100, 0, 0], 'module': 1, 'port': 11}]
+
+
+###############################################
+# Set SkyLED parameters
+# The sky is an addressable RGB LED strip (APA102) driven by its own SPI bus
+# number_of_pixels: number of pixels of the strip, 0 if there is no strip
+# brightness: APA102 global brightness of all pixels (0-31)
+# day, sunset, night, sunrise: colour gradients along the strip, lists of (position, (red, green, blue)) stops
+#       position: from 0.0 (first pixel of the strip) to 1.0 (last pixel of the strip), in increasing order
+#       red, green, blue: 0-255
+# During the day/night transition, the sky goes from 'day' to 'sunset' to 'night',
+# and back from 'night' to 'sunrise' to 'day'
+
+sky_led = {'number_of_pixels': 0, 'brightness': 31,
+           'day':     [(0.0, (120, 170, 255)), (1.0, (200, 225, 255))],
+           'sunset':  [(0.0, (255, 90, 10)), (0.4, (255, 150, 60)), (1.0, (70, 40, 130))],
+           'night':   [(0.0, (0, 0, 25)), (1.0, (5, 5, 50))],
+           'sunrise': [(0.0, (255, 120, 60)), (0.5, (255, 190, 140)), (1.0, (120, 150, 230))]}
+
+
+###############################################
+# Set sensor parameters
+# Occupancy detectors used by the 'Trigger' lights
+# name: name of the sensor, used in the 'sensor' key of the lights
+# pin: GPIO input pin of the detector (BCM numbering)
+# active_low: optional, True if the detector pulls the pin low when a train is detected
+# Example: {'name': 'Shin-Yukari platform 1', 'pin': 17, 'active_low': True}
+
+sensor_list = []